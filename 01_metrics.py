@@ -13,8 +13,16 @@ Docs:
   Genie Context:    https://docs.databricks.com/aws/en/genie/conversation-api
 """
 
-import json
-from config import api_request, execute_sql, gen_id, CATALOG, SCHEMA
+from operator import itemgetter
+
+from config import (
+    api_request, dumps, execute_sql, gen_id,
+    get_serialized_space, patch_serialized_space, patch_subtree,
+    T_INVOICES, T_MV_INVOICE,
+)
+
+_BY_ID = itemgetter("id")
+_BY_IDENTIFIER = itemgetter("identifier")
 
 
 # ---------------------------------------------------------------------------
@@ -32,11 +40,11 @@ def create_space_with_inline_measures(warehouse_id):
         "title": "Finance Metrics Space",
         "description": "Genie space with inline financial measures",
         "warehouse_id": warehouse_id,
-        "serialized_space": json.dumps({
+        "serialized_space": dumps({
             "version": 2,
             "data_sources": {
                 "tables": [
-                    {"identifier": f"{CATALOG}.{SCHEMA}.invoices"}
+                    {"identifier": T_INVOICES}
                 ]
             },
             "instructions": {
@@ -63,7 +71,7 @@ def create_space_with_inline_measures(warehouse_id):
                             "sql": ["AVG(amount)"],
                             "display_name": "avg_invoice_amount"
                         }
-                    ], key=lambda x: x["id"])
+                    ], key=_BY_ID)
                 }
             }
         })
@@ -71,25 +79,9 @@ def create_space_with_inline_measures(warehouse_id):
     return api_request("POST", "/api/2.0/genie/spaces", json_data=payload)
 
 
-def update_space_measures(space_id):
-    """
-    Update inline measures on an existing Genie Space.
-
-    GET  /api/2.0/genie/spaces/{space_id}?include_serialized_space=true
-    PATCH /api/2.0/genie/spaces/{space_id}
-    Docs: https://docs.databricks.com/api/workspace/genie/getspace
-    """
-    # Step 1: GET current config
-    current = api_request(
-        "GET",
-        f"/api/2.0/genie/spaces/{space_id}",
-        params={"include_serialized_space": "true"},
-    )
-    config = json.loads(current["serialized_space"])
-
-    # Step 2: Modify measures
-    config.setdefault("instructions", {}).setdefault("sql_snippets", {})
-    config["instructions"]["sql_snippets"]["measures"] = sorted([
+def _updated_measures():
+    """Replacement measures used by the update examples, sorted by id."""
+    return sorted([
         {
             "id": gen_id(),
             "sql": ["SUM(amount)"],
@@ -100,12 +92,23 @@ def update_space_measures(space_id):
             "sql": ["SUM(amount) / NULLIF(COUNT(DISTINCT invoice_id), 0)"],
             "display_name": "revenue_per_invoice"
         },
-    ], key=lambda x: x["id"])
+    ], key=_BY_ID)
+
 
-    # Step 3: PATCH updated config (all ID-bearing lists must be sorted)
-    return api_request("PATCH", f"/api/2.0/genie/spaces/{space_id}", json_data={
-        "serialized_space": json.dumps(config),
-    })
+def update_space_measures(space_id):
+    """
+    Update inline measures on an existing Genie Space.
+
+    GET  /api/2.0/genie/spaces/{space_id}?include_serialized_space=true
+    PATCH /api/2.0/genie/spaces/{space_id}
+    Docs: https://docs.databricks.com/api/workspace/genie/getspace
+    """
+    # GET current config, replace only the measures list, PATCH it back
+    return patch_subtree(
+        space_id,
+        ("instructions", "sql_snippets", "measures"),
+        lambda _: _updated_measures(),
+    )
 
 
 # ---------------------------------------------------------------------------
@@ -121,14 +124,14 @@ def create_metric_view():
     Docs: https://docs.databricks.com/aws/en/metric-views/create
     """
     ddl = (
-        f"CREATE OR REPLACE VIEW {CATALOG}.{SCHEMA}.mv_invoice\n"
+        f"CREATE OR REPLACE VIEW {T_MV_INVOICE}\n"
         f"WITH METRICS\n"
         f"LANGUAGE YAML\n"
         f"AS $$\n"
         f"  version: 1.1\n"
         f"  comment: \"Invoice financial metrics\"\n"
         f"\n"
-        f"  source: {CATALOG}.{SCHEMA}.invoices\n"
+        f"  source: {T_INVOICES}\n"
         f"\n"
         f"  dimensions:\n"
         f"    - name: Company ID\n"
@@ -159,22 +162,51 @@ def attach_metric_view_to_space(space_id):
     PATCH /api/2.0/genie/spaces/{space_id}
     Docs: https://docs.databricks.com/api/workspace/genie/getspace
     """
-    current = api_request(
-        "GET",
-        f"/api/2.0/genie/spaces/{space_id}",
-        params={"include_serialized_space": "true"},
+    return patch_subtree(
+        space_id,
+        ("data_sources", "metric_views"),
+        lambda views: (views or []) + [{"identifier": T_MV_INVOICE}],
     )
-    config = json.loads(current["serialized_space"])
 
-    config.setdefault("data_sources", {})
-    config["data_sources"].setdefault("metric_views", [])
-    config["data_sources"]["metric_views"].append(
-        {"identifier": f"{CATALOG}.{SCHEMA}.mv_invoice"}
-    )
 
-    return api_request("PATCH", f"/api/2.0/genie/spaces/{space_id}", json_data={
-        "serialized_space": json.dumps(config),
-    })
+# ---------------------------------------------------------------------------
+# Combined update: several edits in one GET + PATCH
+# ---------------------------------------------------------------------------
+
+def update_space(space_id, *, measures=None, append_metric_view=None,
+                 add_tables=None, remove_tables=None):
+    """
+    Apply several edits to a Genie Space with a single GET and PATCH.
+
+    Edits are applied in argument order: replace the inline measures, append
+    a metric view, add tables, then remove tables (all by identifier).
+
+    GET   /api/2.0/genie/spaces/{space_id}?include_serialized_space=true
+    PATCH /api/2.0/genie/spaces/{space_id}
+    Docs: https://docs.databricks.com/api/workspace/genie/getspace
+    """
+    config = get_serialized_space(space_id)
+
+    if measures is not None:
+        instructions = config["instructions"] = config.get("instructions") or {}
+        snippets = instructions["sql_snippets"] = instructions.get("sql_snippets") or {}
+        snippets["measures"] = sorted(measures, key=_BY_ID)
+
+    if append_metric_view or add_tables or remove_tables:
+        data_sources = config["data_sources"] = config.get("data_sources") or {}
+
+    if append_metric_view:
+        metric_views = data_sources["metric_views"] = data_sources.get("metric_views") or []
+        metric_views.append({"identifier": append_metric_view})
+
+    if add_tables or remove_tables:
+        tables = data_sources.get("tables", []) + [{"identifier": tid} for tid in add_tables or ()]
+        drop = set(remove_tables or ())
+        data_sources["tables"] = sorted(
+            (t for t in tables if t["identifier"] not in drop), key=_BY_IDENTIFIER
+        )
+
+    return patch_serialized_space(space_id, config)
 
 
 # ---------------------------------------------------------------------------
@@ -182,29 +214,38 @@ def attach_metric_view_to_space(space_id):
 # ---------------------------------------------------------------------------
 
 if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
     from config import init_from_cli, WAREHOUSE_ID
     init_from_cli()
 
     wh = WAREHOUSE_ID or "cd3b290bff658fa3"
 
-    print("=== Approach A: Inline Measures ===")
-    print("Creating space with inline measures...")
-    result = create_space_with_inline_measures(wh)
-    new_space_id = result["space_id"]
-    print(f"Space created: {new_space_id}")
+    # Creating the space and running the metric view DDL are independent,
+    # so both legs are in flight at once.
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        print("=== Approach A: Inline Measures ===")
+        print("Creating space with inline measures (metric view DDL runs alongside)...")
+        space_future = pool.submit(create_space_with_inline_measures, wh)
+        mv_future = pool.submit(create_metric_view)
+
+        new_space_id = space_future.result()["space_id"]
+        print(f"Space created: {new_space_id}")
 
-    print("\nUpdating inline measures...")
-    update_space_measures(new_space_id)
-    print("Measures updated.")
+        print("\n=== Approach B: Metric Views ===")
+        mv = mv_future.result()
 
-    print("\n=== Approach B: Metric Views ===")
-    print("Creating metric view via DDL...")
-    mv = create_metric_view()
     state = mv.get("status", {}).get("state", "")
-    if state == "SUCCEEDED":
-        print(f"Metric view created: {CATALOG}.{SCHEMA}.mv_invoice")
-        print("\nAttaching metric view to space...")
-        attach_metric_view_to_space(new_space_id)
-        print("Metric view attached.")
+    mv_ok = state == "SUCCEEDED"
+    if mv_ok:
+        print(f"Metric view created: {T_MV_INVOICE}")
     else:
         print(f"Metric view DDL not supported on this workspace (state: {state})")
+
+    # Measures and the metric view attach go out in a single PATCH
+    print("\nUpdating inline measures" + (" and attaching metric view..." if mv_ok else "..."))
+    update_space(
+        new_space_id,
+        measures=_updated_measures(),
+        append_metric_view=T_MV_INVOICE if mv_ok else None,
+    )
+    print("Space updated.")
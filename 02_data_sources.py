@@ -24,8 +24,13 @@ Docs:
   Genie Context:    https://docs.databricks.com/aws/en/genie/conversation-api
 """
 
-import json
-from config import api_request, gen_id, CATALOG, SCHEMA
+import requests
+
+from config import (
+    api_request, dumps, gen_id, forget_space,
+    get_serialized_space, load_space_state, patch_serialized_space,
+    T_ACCOUNTS, T_INVOICES, T_PAYMENTS,
+)
 
 
 def list_spaces():
@@ -61,16 +66,16 @@ def create_space_with_data_sources(warehouse_id):
     Docs: https://docs.databricks.com/api/workspace/genie/createspace
     """
     tables = sorted([
-        {"identifier": f"{CATALOG}.{SCHEMA}.invoices"},
-        {"identifier": f"{CATALOG}.{SCHEMA}.payments"},
-        {"identifier": f"{CATALOG}.{SCHEMA}.accounts"},
+        {"identifier": T_INVOICES},
+        {"identifier": T_PAYMENTS},
+        {"identifier": T_ACCOUNTS},
     ], key=lambda t: t["identifier"])
 
     payload = {
         "title": "Finance Data Space",
         "description": "Genie space for financial data exploration",
         "warehouse_id": warehouse_id,
-        "serialized_space": json.dumps({
+        "serialized_space": dumps({
             "version": 2,
             "data_sources": {"tables": tables},
             "instructions": {
@@ -86,25 +91,104 @@ def create_space_with_data_sources(warehouse_id):
     return api_request("POST", "/api/2.0/genie/spaces", json_data=payload)
 
 
-def add_data_source(space_id, table_identifier):
+class SpaceEditor:
     """
-    Add a new table or view to an existing Genie Space.
+    Batch several data source edits into a single PATCH.
+
+    Starts from the config this process last fetched or had echoed back by a
+    PATCH (or a fresh GET if there is none), applies every mutation in memory, and issues
+    exactly one PATCH on a clean exit. The PATCH carries If-Match with the
+    config's ETag; if the space changed underneath, the server answers 412,
+    and the editor refetches, replays its edits and PATCHes again.
+
+        with SpaceEditor(space_id) as editor:
+            editor.add_table(T_PAYMENTS)
+            editor.remove_table(T_ACCOUNTS)
 
     GET   /api/2.0/genie/spaces/{space_id}?include_serialized_space=true
     PATCH /api/2.0/genie/spaces/{space_id}
     """
-    current = get_space_config(space_id)
-    config = json.loads(current["serialized_space"])
 
-    config.setdefault("data_sources", {}).setdefault("tables", [])
-    config["data_sources"]["tables"].append({"identifier": table_identifier})
-    config["data_sources"]["tables"] = sorted(
-        config["data_sources"]["tables"], key=lambda t: t["identifier"]
-    )
+    def __init__(self, space_id):
+        self.space_id = space_id
+        self.etag = None
+        self.config = None
+        self.result = None
+        self._edits = []
+
+    def __enter__(self):
+        self.etag, self.config = load_space_state(self.space_id, revalidate=False)
+        self._edits = []
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            return False
+        try:
+            self.result = self._patch()
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 412:
+                raise
+            # Space changed since our copy: start from the current version
+            forget_space(self.space_id)
+            self.etag, self.config = load_space_state(self.space_id)
+            for edit, args in self._edits:
+                edit(*args)
+            self.result = self._patch()
+        return False
+
+    def _patch(self):
+        tables = self.config.get("data_sources", {}).get("tables")
+        if tables is not None:
+            tables.sort(key=lambda t: t["identifier"])
+        return patch_serialized_space(self.space_id, self.config, etag=self.etag)
+
+    def _record(self, edit, *args):
+        """Apply an edit now and remember it for replay after a 412."""
+        self._edits.append((edit, args))
+        edit(*args)
+
+    def _tables(self):
+        """Return data_sources.tables from the cached config, creating it if absent."""
+        data_sources = self.config["data_sources"] = self.config.get("data_sources") or {}
+        tables = data_sources["tables"] = data_sources.get("tables") or []
+        return tables
+
+    def _add_table(self, table_identifier):
+        self._tables().append({"identifier": table_identifier})
+
+    def _remove_table(self, table_identifier):
+        tables = self._tables()
+        tables[:] = [t for t in tables if t["identifier"] != table_identifier]
+
+    def _replace_tables(self, table_identifiers):
+        self.config["data_sources"] = {
+            "tables": [{"identifier": tid} for tid in table_identifiers]
+        }
+
+    def add_table(self, table_identifier):
+        """Add a table or view (sorted on exit)."""
+        self._record(self._add_table, table_identifier)
+
+    def remove_table(self, table_identifier):
+        """Remove a table or view by identifier."""
+        self._record(self._remove_table, table_identifier)
+
+    def replace_tables(self, table_identifiers):
+        """Replace all data sources with the given tables."""
+        self._record(self._replace_tables, list(table_identifiers))
+
+
+def add_data_source(space_id, table_identifier):
+    """
+    Add a new table or view to an existing Genie Space.
 
-    return api_request("PATCH", f"/api/2.0/genie/spaces/{space_id}", json_data={
-        "serialized_space": json.dumps(config),
-    })
+    GET   /api/2.0/genie/spaces/{space_id}?include_serialized_space=true
+    PATCH /api/2.0/genie/spaces/{space_id}
+    """
+    with SpaceEditor(space_id) as editor:
+        editor.add_table(table_identifier)
+    return editor.result
 
 
 def remove_data_source(space_id, table_identifier):
@@ -114,17 +198,9 @@ def remove_data_source(space_id, table_identifier):
     GET   /api/2.0/genie/spaces/{space_id}?include_serialized_space=true
     PATCH /api/2.0/genie/spaces/{space_id}
     """
-    current = get_space_config(space_id)
-    config = json.loads(current["serialized_space"])
-
-    config["data_sources"]["tables"] = [
-        t for t in config.get("data_sources", {}).get("tables", [])
-        if t["identifier"] != table_identifier
-    ]
-
-    return api_request("PATCH", f"/api/2.0/genie/spaces/{space_id}", json_data={
-        "serialized_space": json.dumps(config),
-    })
+    with SpaceEditor(space_id) as editor:
+        editor.remove_table(table_identifier)
+    return editor.result
 
 
 def replace_all_data_sources(space_id, table_identifiers):
@@ -134,19 +210,9 @@ def replace_all_data_sources(space_id, table_identifiers):
     GET   /api/2.0/genie/spaces/{space_id}?include_serialized_space=true
     PATCH /api/2.0/genie/spaces/{space_id}
     """
-    current = get_space_config(space_id)
-    config = json.loads(current["serialized_space"])
-
-    config["data_sources"] = {
-        "tables": sorted(
-            [{"identifier": tid} for tid in table_identifiers],
-            key=lambda t: t["identifier"]
-        )
-    }
-
-    return api_request("PATCH", f"/api/2.0/genie/spaces/{space_id}", json_data={
-        "serialized_space": json.dumps(config),
-    })
+    with SpaceEditor(space_id) as editor:
+        editor.replace_tables(table_identifiers)
+    return editor.result
 
 
 if __name__ == "__main__":
@@ -166,11 +232,10 @@ if __name__ == "__main__":
     print(f"Space created: {new_space_id}")
 
     print("\n=== Remove Data Source ===")
-    remove_data_source(new_space_id, f"{CATALOG}.{SCHEMA}.accounts")
-    print(f"Removed: {CATALOG}.{SCHEMA}.accounts")
+    remove_data_source(new_space_id, T_ACCOUNTS)
+    print(f"Removed: {T_ACCOUNTS}")
 
     print("\n=== Current Config ===")
-    config = get_space_config(new_space_id)
-    parsed = json.loads(config["serialized_space"])
+    parsed = get_serialized_space(new_space_id)
     for t in parsed.get("data_sources", {}).get("tables", []):
         print(f"  {t['identifier']}")
@@ -50,6 +50,21 @@ def get_permissions(space_id):
     return api_request("GET", f"/api/2.0/permissions/genie/{space_id}")
 
 
+def bulk_add_permissions(space_id, entries):
+    """
+    Grant permissions to many principals in a single additive PATCH.
+
+    Each entry is an ACL dict such as
+    {"user_name": ..., "permission_level": ...}, with group_name or
+    service_principal_name in place of user_name as needed.
+
+    PATCH /api/2.0/permissions/genie/{space_id}
+    Docs: https://docs.databricks.com/api/workspace/permissions/update
+    """
+    payload = {"access_control_list": list(entries)}
+    return api_request("PATCH", f"/api/2.0/permissions/genie/{space_id}", json_data=payload)
+
+
 def add_user_permission(space_id, user_name, permission_level):
     """
     Grant a permission level to a specific user (additive PATCH).
@@ -57,12 +72,9 @@ def add_user_permission(space_id, user_name, permission_level):
     PATCH /api/2.0/permissions/genie/{space_id}
     Docs: https://docs.databricks.com/api/workspace/permissions/update
     """
-    payload = {
-        "access_control_list": [
-            {"user_name": user_name, "permission_level": permission_level}
-        ]
-    }
-    return api_request("PATCH", f"/api/2.0/permissions/genie/{space_id}", json_data=payload)
+    return bulk_add_permissions(space_id, [
+        {"user_name": user_name, "permission_level": permission_level}
+    ])
 
 
 def add_group_permission(space_id, group_name, permission_level):
@@ -72,12 +84,9 @@ def add_group_permission(space_id, group_name, permission_level):
     PATCH /api/2.0/permissions/genie/{space_id}
     Docs: https://docs.databricks.com/api/workspace/permissions/update
     """
-    payload = {
-        "access_control_list": [
-            {"group_name": group_name, "permission_level": permission_level}
-        ]
-    }
-    return api_request("PATCH", f"/api/2.0/permissions/genie/{space_id}", json_data=payload)
+    return bulk_add_permissions(space_id, [
+        {"group_name": group_name, "permission_level": permission_level}
+    ])
 
 
 def add_service_principal_permission(space_id, sp_name, permission_level):
@@ -87,12 +96,9 @@ def add_service_principal_permission(space_id, sp_name, permission_level):
     PATCH /api/2.0/permissions/genie/{space_id}
     Docs: https://docs.databricks.com/api/workspace/permissions/update
     """
-    payload = {
-        "access_control_list": [
-            {"service_principal_name": sp_name, "permission_level": permission_level}
-        ]
-    }
-    return api_request("PATCH", f"/api/2.0/permissions/genie/{space_id}", json_data=payload)
+    return bulk_add_permissions(space_id, [
+        {"service_principal_name": sp_name, "permission_level": permission_level}
+    ])
 
 
 def replace_all_permissions(space_id, access_control_list):
@@ -113,15 +119,12 @@ def bulk_grant_example(space_id):
     PATCH /api/2.0/permissions/genie/{space_id}
     Docs: https://docs.databricks.com/api/workspace/permissions/update
     """
-    payload = {
-        "access_control_list": [
-            {"user_name": "analyst@company.com", "permission_level": "CAN_READ"},
-            {"user_name": "data-engineer@company.com", "permission_level": "CAN_EDIT"},
-            {"group_name": "finance-analysts", "permission_level": "CAN_RUN"},
-            {"group_name": "finance-admins", "permission_level": "CAN_MANAGE"},
-        ]
-    }
-    return api_request("PATCH", f"/api/2.0/permissions/genie/{space_id}", json_data=payload)
+    return bulk_add_permissions(space_id, [
+        {"user_name": "analyst@company.com", "permission_level": "CAN_READ"},
+        {"user_name": "data-engineer@company.com", "permission_level": "CAN_EDIT"},
+        {"group_name": "finance-analysts", "permission_level": "CAN_RUN"},
+        {"group_name": "finance-admins", "permission_level": "CAN_MANAGE"},
+    ])
 
 
 if __name__ == "__main__":
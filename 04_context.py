@@ -27,8 +27,40 @@ Docs:
   Genie Setup:      https://docs.databricks.com/aws/en/genie/set-up
 """
 
-import json
-from config import api_request, gen_id, CATALOG, SCHEMA
+from operator import itemgetter
+
+from config import (
+    api_request, dumps, gen_id,
+    get_serialized_space, patch_serialized_space,
+    T_ACCOUNTS, T_INVOICES, T_PAYMENTS,
+)
+
+_BY_ID = itemgetter("id")
+_BY_IDENTIFIER = itemgetter("identifier")
+
+# Static rows for build_full_context_payload; only the ids are generated per call
+_SAMPLE_QUESTIONS = (
+    "What is our total revenue this quarter?",
+    "Which companies have the most overdue invoices?",
+    "Show me payment trends over the last 6 months.",
+    "What is the average invoice amount by company?",
+)
+
+# (display_name, sql)
+_FILTERS = (
+    ("Paid invoices only", "invoices.status = 'PAID'"),
+    ("Last 90 days", "invoices.invoice_date >= DATE_ADD(CURRENT_DATE(), -90)"),
+)
+
+_EXPRESSIONS = (
+    ("invoice_size", "CASE WHEN amount > 10000 THEN 'Large' WHEN amount > 1000 THEN 'Medium' ELSE 'Small' END"),
+)
+
+_MEASURES = (
+    ("total_revenue", "SUM(amount)"),
+    ("invoice_count", "COUNT(DISTINCT invoice_id)"),
+    ("overdue_amount", "SUM(CASE WHEN status = 'OVERDUE' THEN amount ELSE 0 END)"),
+)
 
 
 def get_context(space_id):
@@ -38,12 +70,7 @@ def get_context(space_id):
     GET /api/2.0/genie/spaces/{space_id}?include_serialized_space=true
     Docs: https://docs.databricks.com/api/workspace/genie/getspace
     """
-    result = api_request(
-        "GET",
-        f"/api/2.0/genie/spaces/{space_id}",
-        params={"include_serialized_space": "true"},
-    )
-    return json.loads(result["serialized_space"])
+    return get_serialized_space(space_id)
 
 
 def update_context(space_id, serialized_space_dict):
@@ -53,24 +80,26 @@ def update_context(space_id, serialized_space_dict):
     PATCH /api/2.0/genie/spaces/{space_id}
     Docs: https://docs.databricks.com/aws/en/genie/conversation-api
     """
-    return api_request("PATCH", f"/api/2.0/genie/spaces/{space_id}", json_data={
-        "serialized_space": json.dumps(serialized_space_dict),
-    })
+    return patch_serialized_space(space_id, serialized_space_dict)
 
 
 def _sorted_by_id(items):
     """Sort a list of dicts by their 'id' field (API requirement)."""
-    return sorted(items, key=lambda x: x.get("id", ""))
+    return sorted(items, key=_BY_ID)
+
+
+def _snippets(rows):
+    """Build sql_snippets entries from (display_name, sql) rows, sorted by id."""
+    return _sorted_by_id([
+        {"id": gen_id(), "sql": [sql], "display_name": name} for name, sql in rows
+    ])
 
 
 def build_full_context_payload(warehouse_id):
     """Build a comprehensive space payload demonstrating all context source types."""
 
     sample_questions = _sorted_by_id([
-        {"id": gen_id(), "question": ["What is our total revenue this quarter?"]},
-        {"id": gen_id(), "question": ["Which companies have the most overdue invoices?"]},
-        {"id": gen_id(), "question": ["Show me payment trends over the last 6 months."]},
-        {"id": gen_id(), "question": ["What is the average invoice amount by company?"]},
+        {"id": gen_id(), "question": [q]} for q in _SAMPLE_QUESTIONS
     ])
 
     text_instructions = [{
@@ -92,7 +121,7 @@ def build_full_context_payload(warehouse_id):
             "question": ["Total revenue by quarter"],
             "sql": [
                 f"SELECT fiscal_quarter, SUM(amount) AS total_revenue ",
-                f"FROM {CATALOG}.{SCHEMA}.invoices ",
+                f"FROM {T_INVOICES} ",
                 "GROUP BY fiscal_quarter ORDER BY fiscal_quarter"
             ]
         },
@@ -101,53 +130,38 @@ def build_full_context_payload(warehouse_id):
             "question": ["Overdue invoices by company"],
             "sql": [
                 f"SELECT a.company_name, COUNT(*) AS overdue_count, SUM(i.amount) AS overdue_total ",
-                f"FROM {CATALOG}.{SCHEMA}.invoices i ",
-                f"JOIN {CATALOG}.{SCHEMA}.accounts a ON i.company_id = a.account_id ",
+                f"FROM {T_INVOICES} i ",
+                f"JOIN {T_ACCOUNTS} a ON i.company_id = a.account_id ",
                 "WHERE i.status = 'OVERDUE' ",
                 "GROUP BY a.company_name ORDER BY overdue_total DESC"
             ]
         },
     ])
 
-    filters = _sorted_by_id([
-        {"id": gen_id(), "sql": ["invoices.status = 'PAID'"], "display_name": "Paid invoices only"},
-        {"id": gen_id(), "sql": ["invoices.invoice_date >= DATE_ADD(CURRENT_DATE(), -90)"], "display_name": "Last 90 days"},
-    ])
-
-    expressions = _sorted_by_id([
-        {
-            "id": gen_id(),
-            "sql": ["CASE WHEN amount > 10000 THEN 'Large' WHEN amount > 1000 THEN 'Medium' ELSE 'Small' END"],
-            "display_name": "invoice_size"
-        }
-    ])
-
-    measures = _sorted_by_id([
-        {"id": gen_id(), "sql": ["SUM(amount)"], "display_name": "total_revenue"},
-        {"id": gen_id(), "sql": ["COUNT(DISTINCT invoice_id)"], "display_name": "invoice_count"},
-        {"id": gen_id(), "sql": ["SUM(CASE WHEN status = 'OVERDUE' THEN amount ELSE 0 END)"], "display_name": "overdue_amount"},
-    ])
+    filters = _snippets(_FILTERS)
+    expressions = _snippets(_EXPRESSIONS)
+    measures = _snippets(_MEASURES)
 
     return {
         "title": "Finance Analytics Space",
         "description": "Comprehensive financial analytics with full context",
         "warehouse_id": warehouse_id,
-        "serialized_space": json.dumps({
+        "serialized_space": dumps({
             "version": 2,
             "config": {"sample_questions": sample_questions},
             "data_sources": {
                 "tables": sorted([
                     {
-                        "identifier": f"{CATALOG}.{SCHEMA}.invoices",
+                        "identifier": T_INVOICES,
                         "column_configs": [
                             {"column_name": "amount", "enable_format_assistance": True},
                             {"column_name": "company_id", "enable_entity_matching": True, "enable_format_assistance": True},
                             {"column_name": "status", "enable_entity_matching": True, "enable_format_assistance": True},
                         ]
                     },
-                    {"identifier": f"{CATALOG}.{SCHEMA}.accounts"},
-                    {"identifier": f"{CATALOG}.{SCHEMA}.payments"},
-                ], key=lambda t: t["identifier"])
+                    {"identifier": T_ACCOUNTS},
+                    {"identifier": T_PAYMENTS},
+                ], key=_BY_IDENTIFIER)
             },
             "instructions": {
                 "text_instructions": text_instructions,
@@ -14,7 +14,30 @@ Docs:
 """
 
 import json
-from config import api_request, execute_sql, CATALOG, SCHEMA
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    api_request, execute_sql, forget_space, CATALOG, SCHEMA,
+    T_ACCOUNTS, T_INVOICES, T_MV_INVOICE, T_PAYMENTS,
+)
+
+
+# Titles used by the examples, demo and integration tests
+TEST_KEYWORDS = (
+    "Test Metrics Space",
+    "Test Data Sources Space",
+    "Test Permissions Space",
+    "Test Context Space",
+    "Finance Metrics Space",
+    "Finance Data Space",
+    "Finance Analytics Space",
+    "Genie API Examples",
+    "Genie API Demo",
+)
+
+# One case-insensitive scan per title instead of a substring probe per keyword
+_TEST_TITLE_RE = re.compile("|".join(map(re.escape, TEST_KEYWORDS)), re.IGNORECASE)
 
 
 def list_spaces():
@@ -23,49 +46,41 @@ def list_spaces():
 
 
 def delete_space(space_id):
-    """Delete a Genie Space by ID."""
-    return api_request("DELETE", f"/api/2.0/genie/spaces/{space_id}")
+    """Delete a Genie Space by ID and drop its cached serialized_space."""
+    result = api_request("DELETE", f"/api/2.0/genie/spaces/{space_id}")
+    forget_space(space_id)
+    return result
 
 
 def find_test_spaces():
     """Find spaces created by the genie_api examples."""
     spaces = list_spaces()
-    test_keywords = [
-        "Test Metrics Space",
-        "Test Data Sources Space",
-        "Test Permissions Space",
-        "Test Context Space",
-        "Finance Metrics Space",
-        "Finance Data Space",
-        "Finance Analytics Space",
-        "Genie API Examples",
-        "Genie API Demo",
+    return [
+        s for s in spaces.get("spaces", [])
+        if _TEST_TITLE_RE.search(s.get("title", ""))
     ]
-    matches = []
-    for s in spaces.get("spaces", []):
-        title = s.get("title", "")
-        if any(kw.lower() in title.lower() for kw in test_keywords):
-            matches.append(s)
-    return matches
+
+
+def _drop_one(obj):
+    """Drop a table, falling back to DROP VIEW. Returns (obj, state)."""
+    r = execute_sql(f"DROP TABLE IF EXISTS {obj}")
+    state = r.get("status", {}).get("state", "")
+    if state != "SUCCEEDED":
+        r = execute_sql(f"DROP VIEW IF EXISTS {obj}")
+        state = r.get("status", {}).get("state", "")
+    return obj, state
 
 
 def drop_test_tables():
-    """Drop tables and views created by the examples."""
+    """Drop tables and views created by the examples (up to 4 DROPs in flight)."""
     objects = [
-        f"{CATALOG}.{SCHEMA}.invoices",
-        f"{CATALOG}.{SCHEMA}.payments",
-        f"{CATALOG}.{SCHEMA}.accounts",
-        f"{CATALOG}.{SCHEMA}.mv_invoice",
+        T_INVOICES,
+        T_PAYMENTS,
+        T_ACCOUNTS,
+        T_MV_INVOICE,
     ]
-    results = []
-    for obj in objects:
-        r = execute_sql(f"DROP TABLE IF EXISTS {obj}")
-        state = r.get("status", {}).get("state", "")
-        if state != "SUCCEEDED":
-            r = execute_sql(f"DROP VIEW IF EXISTS {obj}")
-            state = r.get("status", {}).get("state", "")
-        results.append((obj, state))
-    return results
+    with ThreadPoolExecutor(max_workers=min(len(objects), 4)) as pool:
+        return list(pool.map(_drop_one, objects))
 
 
 def drop_test_schema():
@@ -10,60 +10,531 @@ Docs:
   Permissions API:       https://docs.databricks.com/api/workspace/permissions
 """
 
+import gzip
 import json
 import os
+import re
 import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # optional; falls back to stdlib json
+    orjson = None
 
 HOST = os.environ.get("DATABRICKS_HOST", "https://e2-demo-field-eng.cloud.databricks.com")
 TOKEN = os.environ.get("DATABRICKS_TOKEN", "")
 
 CATALOG = "waggoner"
 SCHEMA = "finance"
+
+
+def table_id(name):
+    """Return the interned three-level identifier for name in CATALOG.SCHEMA."""
+    return sys.intern(f"{CATALOG}.{SCHEMA}.{name}")
+
+
+T_INVOICES = table_id("invoices")
+T_PAYMENTS = table_id("payments")
+T_ACCOUNTS = table_id("accounts")
+T_MV_INVOICE = table_id("mv_invoice")
 WAREHOUSE_ID = os.environ.get("DATABRICKS_WAREHOUSE_ID", "")
 
+# Opt-in: request bodies at least this many bytes are sent gzip-compressed.
+# Off (0) by default since the Genie, Permissions and SQL APIs don't document
+# accepting Content-Encoding: gzip request bodies.
+GZIP_MIN_BYTES = int(os.environ.get("DATABRICKS_GZIP_MIN_BYTES", "0"))
+
+
+# Tokens minted by the CLI: profile -> (access_token, expiry epoch seconds)
+_TOKEN_CACHE = {}
+_PROFILE = None
+
+# Re-mint a CLI token once it has less than this many seconds left
+TOKEN_EXPIRY_BUFFER = 60
+
+# Lifetime assumed for a CLI token whose expiry is missing or unparseable
+UNKNOWN_EXPIRY_TTL = 300
+
+
+def _parse_expiry(value):
+    """Parse the CLI's RFC 3339 expiry into epoch seconds, or None.
+
+    The CLI trims trailing zeros from a fraction of up to 9 digits, while
+    fromisoformat before Python 3.11 takes exactly 3 or 6, so the fraction
+    is padded or truncated to 6.
+    """
+    if not value:
+        return None
+    value = re.sub(r"\.(\d+)", lambda m: "." + m.group(1)[:6].ljust(6, "0"), value)
+    value = value.replace("Z", "+00:00")
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+def _token_fresh(expiry):
+    return expiry is not None and expiry - time.time() > TOKEN_EXPIRY_BUFFER
+
 
 def init_from_cli(profile="e2-field"):
-    """Initialize HOST/TOKEN/WAREHOUSE_ID from Databricks CLI profile."""
-    global HOST, TOKEN, WAREHOUSE_ID
+    """Initialize HOST/TOKEN/WAREHOUSE_ID from Databricks CLI profile.
+
+    A token minted earlier in this process for the same profile is reused
+    while it has more than TOKEN_EXPIRY_BUFFER seconds left, so repeat calls
+    do not spawn the CLI again.
+    """
+    global HOST, TOKEN, WAREHOUSE_ID, _PROFILE
+    _PROFILE = profile
+    cached = _TOKEN_CACHE.get(profile)
+    if cached and _token_fresh(cached[1]):
+        TOKEN = cached[0]
+        return TOKEN
+
     result = subprocess.run(
         ["databricks", "auth", "token", f"--profile={profile}"],
         capture_output=True, text=True,
     )
     token_data = json.loads(result.stdout)
     TOKEN = token_data["access_token"]
+    # An unknown expiry gets a short assumed lifetime, never "fresh forever"
+    expiry = _parse_expiry(token_data.get("expiry")) or time.time() + UNKNOWN_EXPIRY_TTL
+    _TOKEN_CACHE[profile] = (TOKEN, expiry)
+    return TOKEN
+
+
+def ensure_token():
+    """Return a usable TOKEN, re-minting it via the CLI when close to expiry.
+
+    Tokens set through DATABRICKS_TOKEN (no CLI profile) are returned as is.
+    """
+    if _PROFILE is not None:
+        cached = _TOKEN_CACHE.get(_PROFILE)
+        if not cached or not _token_fresh(cached[1]):
+            init_from_cli(_PROFILE)
+    return TOKEN
+
+
+if orjson is not None:
+    def dumps(obj):
+        """Encode obj as a compact JSON string (orjson)."""
+        return orjson.dumps(obj).decode()
+
+    _encode = orjson.dumps
+    loads = orjson.loads
+else:
+    def dumps(obj):
+        """Encode obj as a compact JSON string."""
+        return json.dumps(obj, separators=(",", ":"))
+
+    def _encode(obj):
+        return dumps(obj).encode()
+
+    loads = json.loads
+
+
+# (connect, read) seconds; read covers the 50s Statement Execution wait_timeout
+TIMEOUT = (5, 55)
+
+# One pooled keep-alive session for every call, so a script pays the TLS handshake once.
+# pool_maxsize covers the concurrent tests each fanning out batch_api_request
+# workers; below that urllib3 discards surplus connections and re-handshakes.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    # Transient 429/5xx only; 400/403/404 are terminal. POST is left out because
+    # replaying a create after a 502/504 can duplicate the space.
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.1,
+        backoff_jitter=0.1,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset(["GET", "PATCH", "PUT", "DELETE"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    ),
+))
+
+
+_HEADERS_CACHE = (None, None)  # (token, headers); swapped as one tuple
 
 
 def _headers():
-    return {
-        "Authorization": f"Bearer {TOKEN}",
-        "Content-Type": "application/json",
-    }
+    """Return the shared request headers, rebuilt only when the token changes.
 
+    Callers must copy before mutating. Auth is not set on _SESSION.headers
+    because the session also fetches presigned result links.
+    """
+    global _HEADERS_CACHE
+    token = ensure_token()
+    cached_token, headers = _HEADERS_CACHE
+    if cached_token != token:
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+        }
+        _HEADERS_CACHE = (token, headers)
+    return headers
+
+
+def _send(method, path, json_data=None, params=None, headers=None, data=None):
+    """Send an authenticated request and return the raw response.
 
-def api_request(method, path, json_data=None, params=None):
-    """Make an authenticated request to the Databricks REST API."""
+    json_data is encoded here with the fast encoder and sent as bytes rather
+    than through requests' json= (stdlib json); pass data instead for a body
+    that is already encoded JSON bytes. serialized_space is already a
+    string at this point, so the envelope costs one escape pass, not a second
+    tree walk. If GZIP_MIN_BYTES is set, bodies at least that large are
+    gzip-compressed; the repeated keys and table identifiers in
+    serialized_space compress well.
+    Responses are decompressed by requests, which advertises gzip by default.
+    """
     url = f"{HOST}{path}"
-    resp = requests.request(method, url, headers=_headers(), json=json_data, params=params)
+    headers = {**_headers(), **(headers or {})}
+    if json_data is not None:
+        data = _encode(json_data)
+    if data is not None and GZIP_MIN_BYTES and len(data) >= GZIP_MIN_BYTES:
+        data = gzip.compress(data, compresslevel=1)
+        headers["Content-Encoding"] = "gzip"
+    for attempt in range(2):
+        resp = _SESSION.request(
+            method, url, headers=headers, data=data, params=params, timeout=TIMEOUT,
+        )
+        if resp.status_code != 401 or _PROFILE is None or attempt:
+            break
+        # Token expired or was revoked early: mint a fresh one and retry once
+        _TOKEN_CACHE.pop(_PROFILE, None)
+        headers["Authorization"] = f"Bearer {init_from_cli(_PROFILE)}"
     resp.raise_for_status()
+    return resp
+
+
+def api_request(method, path, json_data=None, params=None, data=None):
+    """Make an authenticated request to the Databricks REST API.
+
+    Pass either json_data (a dict to encode) or data (pre-encoded JSON bytes).
+    """
+    resp = _send(method, path, json_data=json_data, params=params, data=data)
     return resp.json() if resp.text else {}
 
 
-def execute_sql(statement, warehouse_id=None):
+def batch_api_request(calls, max_workers=8):
+    """Issue independent API calls concurrently and collect per-call results.
+
+    Each call is a dict with id, method, path and optional json_data/params.
+    Databricks has no batch endpoint, so this fans the calls out over the
+    pooled session instead of sending one envelope. Returns one dict per call,
+    in input order: {"id", "status", "body"} on success or {"id", "status",
+    "error"} on failure. A failed call does not affect the others.
+    """
+    def run(call):
+        try:
+            resp = _send(call["method"], call["path"],
+                         json_data=call.get("json_data"), params=call.get("params"))
+            return {"id": call["id"], "status": resp.status_code,
+                    "body": resp.json() if resp.text else {}}
+        except requests.RequestException as e:
+            status = e.response.status_code if e.response is not None else None
+            return {"id": call["id"], "status": status, "error": str(e)}
+        except Exception as e:  # e.g. a failed token re-mint or a non-JSON body
+            return {"id": call["id"], "status": None, "error": str(e)}
+
+    if not calls:
+        return []
+    with ThreadPoolExecutor(max_workers=min(len(calls), max_workers)) as pool:
+        return list(pool.map(run, calls))
+
+
+# space_id -> (etag, serialized_space text) from the last GET that carried an ETag
+_CONFIG_CACHE = {}
+
+# Persisted copy of _CONFIG_CACHE so re-running a script can revalidate instead of re-download
+CACHE_DIR = os.path.expanduser(os.environ.get("GENIE_API_CACHE_DIR", "~/.genie_api_cache"))
+
+
+def _disk_cache_get(space_id):
+    """Return (etag, serialized_space text) saved for space_id, or None."""
+    base = os.path.join(CACHE_DIR, space_id)
+    try:
+        with open(f"{base}.etag") as f:
+            etag = f.read().strip()
+        with open(f"{base}.json") as f:
+            serialized = f.read()
+    except OSError:
+        return None
+    return (etag, serialized) if etag else None
+
+
+def _disk_cache_put(space_id, etag, serialized):
+    """Save serialized_space text and its ETag under CACHE_DIR (best effort)."""
+    base = os.path.join(CACHE_DIR, space_id)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(f"{base}.json", "w") as f:
+            f.write(serialized)
+        with open(f"{base}.etag", "w") as f:
+            f.write(etag)
+    except OSError:
+        pass
+
+
+def _remember_space(space_id, etag, serialized):
+    """Record the serialized_space text the server holds under etag."""
+    if etag:
+        _CONFIG_CACHE[space_id] = (etag, serialized)
+        _disk_cache_put(space_id, etag, serialized)
+    else:
+        _CONFIG_CACHE.pop(space_id, None)
+
+
+def forget_space(space_id):
+    """Drop any cached serialized_space for space_id, in memory and on disk."""
+    _CONFIG_CACHE.pop(space_id, None)
+    for ext in ("json", "etag"):
+        try:
+            os.remove(os.path.join(CACHE_DIR, f"{space_id}.{ext}"))
+        except OSError:
+            pass
+
+
+def load_space_state(space_id, *, revalidate=True):
+    """Return (etag, parsed serialized_space) for a Genie Space.
+
+    When the previous fetch returned an ETag (in this process or a previous
+    run, via CACHE_DIR), the GET is sent with If-None-Match so an unchanged
+    space comes back as an empty 304 and the cached text is reused. With
+    revalidate=False, a copy already fetched (or echoed back by a PATCH) in
+    this process is returned without any request; pair it with If-Match on
+    the PATCH. The cache holds text rather than the parsed dict because
+    callers mutate the returned config in place. etag is None if the server does not send one.
+
+    Docs: https://docs.databricks.com/api/workspace/genie/getspace
+    """
+    cached = _CONFIG_CACHE.get(space_id)
+    if cached and not revalidate:
+        return cached[0], loads(cached[1])
+
+    cached = cached or _disk_cache_get(space_id)
+    headers = {"If-None-Match": cached[0]} if cached else None
+    resp = _send(
+        "GET",
+        f"/api/2.0/genie/spaces/{space_id}",
+        params={"include_serialized_space": "true"},
+        headers=headers,
+    )
+    if resp.status_code == 304:
+        return cached[0], loads(cached[1])
+
+    serialized = resp.json()["serialized_space"]
+    etag = resp.headers.get("ETag")
+    _remember_space(space_id, etag, serialized)
+    return etag, loads(serialized)
+
+
+def get_serialized_space(space_id):
+    """Fetch and parse the serialized_space of a Genie Space (see load_space_state)."""
+    return load_space_state(space_id)[1]
+
+
+def patch_subtree(space_id, path, mutate_fn):
+    """Replace one subtree of a space's serialized_space and PATCH it back.
+
+    path is a tuple of keys, e.g. ("instructions", "sql_snippets", "measures").
+    Missing parents are created; mutate_fn receives the current value (None if
+    absent) and returns the new one. Nothing outside the path is touched.
+    """
+    config = get_serialized_space(space_id)
+    node = config
+    for key in path[:-1]:
+        child = node.get(key) or {}
+        node[key] = child
+        node = child
+    node[path[-1]] = mutate_fn(node.get(path[-1]))
+    return patch_serialized_space(space_id, config)
+
+
+def patch_serialized_space(space_id, config, etag=None):
+    """PATCH a Genie Space with an updated serialized_space dict.
+
+    The API takes serialized_space as a JSON *string*, not a nested object,
+    so the config is encoded exactly once here and the envelope only escapes
+    that string (see _send). All ID-bearing lists must already be sorted.
+
+    With etag, the PATCH carries If-Match and fails with 412 if the space
+    changed since that version. The cache is only refreshed from the
+    serialized_space the server echoes back, since the server may normalize
+    what was sent; otherwise the entry is dropped so the next read is a real
+    GET rather than a 304 vouching for the client's text.
+
+    Docs: https://docs.databricks.com/aws/en/genie/conversation-api
+    """
+    serialized = dumps(config)
+    resp = _send(
+        "PATCH",
+        f"/api/2.0/genie/spaces/{space_id}",
+        json_data={"serialized_space": serialized},
+        headers={"If-Match": etag} if etag else None,
+    )
+    body = resp.json() if resp.text else {}
+    if "serialized_space" in body:
+        _remember_space(space_id, resp.headers.get("ETag"), body["serialized_space"])
+    else:
+        forget_space(space_id)
+    return body
+
+
+class _Breaker:
+    """Circuit breaker for the Statement Execution endpoint.
+
+    CLOSED until FAILURE_THRESHOLD consecutive failures, then OPEN: calls
+    short-circuit for COOL_DOWN seconds. After that one probe goes through
+    (HALF_OPEN); success closes the circuit, failure re-opens it.
+    """
+
+    FAILURE_THRESHOLD = 3
+    COOL_DOWN = 30
+
+    def __init__(self):
+        self.state = "CLOSED"
+        self.fail_count = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "CLOSED":
+                return True
+            if self.state == "OPEN" and time.time() - self.opened_at >= self.COOL_DOWN:
+                self.state = "HALF_OPEN"
+                return True
+            return False
+
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                self.state = "CLOSED"
+                self.fail_count = 0
+                return
+            self.fail_count += 1
+            if self.state == "HALF_OPEN" or self.fail_count >= self.FAILURE_THRESHOLD:
+                self.state = "OPEN"
+                self.opened_at = time.time()
+
+
+_SQL_BREAKER = _Breaker()
+
+
+def execute_sql(statement, warehouse_id=None, *, fmt="JSON_ARRAY", wait_timeout="50s"):
     """Execute a SQL statement via the Statement Execution API.
 
+    fmt="JSON_ARRAY" (the default, fine for DDL) returns rows inline. For
+    row-returning queries pass fmt="ARROW_STREAM": the result is then left on
+    cloud storage as EXTERNAL_LINKS and read with iter_result_bytes.
+
+    wait_timeout="0s" submits without waiting and returns the statement_id
+    while it is still PENDING/RUNNING; finish it with wait_for_statement.
+
+    Returns {"status": {"state": "CIRCUIT_OPEN"}} without calling the API
+    while repeated failures (e.g. a cold or paused warehouse) have the
+    breaker open.
+
     Docs: https://docs.databricks.com/api/workspace/statementexecution/executestatement
     """
+    if not _SQL_BREAKER.allow():
+        return {"status": {"state": "CIRCUIT_OPEN"}}
     payload = {
         "statement": statement,
         "warehouse_id": warehouse_id or WAREHOUSE_ID,
-        "format": "JSON_ARRAY",
-        "wait_timeout": "50s",
+        "format": fmt,
+        "wait_timeout": wait_timeout,
     }
-    return api_request("POST", "/api/2.0/sql/statements/", json_data=payload)
+    if fmt != "JSON_ARRAY":
+        payload["disposition"] = "EXTERNAL_LINKS"  # INLINE only supports JSON_ARRAY
+    try:
+        result = api_request("POST", "/api/2.0/sql/statements/", json_data=payload)
+    except Exception:  # any error, so a half-open probe can never wedge the breaker
+        _SQL_BREAKER.record(False)
+        raise
+    # FAILED means the warehouse ran the statement and rejected it (e.g. DROP
+    # TABLE on a view); only timeouts and cancellations count against it.
+    # Without a wait, PENDING/RUNNING just means the submission was accepted.
+    ok_states = ("SUCCEEDED", "FAILED")
+    if wait_timeout == "0s":
+        ok_states += ("PENDING", "RUNNING")
+    _SQL_BREAKER.record(result.get("status", {}).get("state") in ok_states)
+    return result
+
+
+def wait_for_statement(result, timeout=120):
+    """Poll a statement submitted with wait_timeout="0s" until it finishes.
+
+    Polls back off exponentially from 0.25s to 5s. Returns the latest
+    statement response, still PENDING/RUNNING if timeout ran out.
+
+    Docs: https://docs.databricks.com/api/workspace/statementexecution/getstatement
+    """
+    delay = 0.25
+    deadline = time.monotonic() + timeout
+    while result.get("status", {}).get("state") in ("PENDING", "RUNNING"):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 5)
+        result = api_request("GET", f"/api/2.0/sql/statements/{result['statement_id']}")
+    return result
+
+
+def iter_result_bytes(result, chunk_size=1 << 16):
+    """Stream the raw bytes of an EXTERNAL_LINKS statement result, chunk by chunk.
+
+    Nothing is buffered or decoded; for ARROW_STREAM the bytes can be fed to
+    pyarrow.ipc.open_stream. Presigned links must be fetched without the
+    Authorization header, which the shared session never sets, but with any
+    http_headers the link lists (e.g. encryption keys).
+
+    Docs: https://docs.databricks.com/api/workspace/statementexecution/getstatementresultchunkn
+    """
+    links = (result.get("result") or {}).get("external_links") or []
+    while links:
+        next_link = None
+        for link in links:
+            with _SESSION.get(link["external_link"], headers=link.get("http_headers"),
+                              stream=True, timeout=TIMEOUT) as resp:
+                resp.raise_for_status()
+                yield from resp.iter_content(chunk_size=chunk_size)
+            next_link = link.get("next_chunk_internal_link")
+        if not next_link:
+            break
+        links = api_request("GET", next_link).get("external_links") or []
+
+
+_ID_BATCH = 64
+_id_pool = []
+_id_lock = threading.Lock()
+# A forked child inherits the pool; clear it there so parent and child never
+# hand out the same IDs
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_id_pool.clear)
 
 
 def gen_id():
-    """Generate a 32-character hex ID for serialized_space objects."""
-    import uuid
-    return uuid.uuid4().hex
+    """Generate a 32-character hex ID for serialized_space objects.
+
+    IDs are drawn from a pool refilled _ID_BATCH at a time from a single
+    os.urandom read; the lock keeps concurrent callers from sharing an ID.
+    """
+    with _id_lock:
+        if not _id_pool:
+            entropy = os.urandom(16 * _ID_BATCH).hex()
+            _id_pool.extend(entropy[i:i + 32] for i in range(0, len(entropy), 32))
+        return _id_pool.pop()
@@ -13,20 +13,30 @@ Docs:
   Permissions API:  https://docs.databricks.com/api/workspace/permissions
 """
 
-import json
 import sys
-import uuid
+from bisect import insort
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
 
 sys.path.insert(0, ".")
-from config import api_request, execute_sql, init_from_cli, gen_id, CATALOG, SCHEMA
+import config
+from config import (
+    api_request, dumps, ensure_token, execute_sql, init_from_cli, gen_id, loads,
+    patch_serialized_space, CATALOG, SCHEMA, TIMEOUT, _SESSION,
+    T_ACCOUNTS, T_INVOICES, T_MV_INVOICE, T_PAYMENTS,
+)
 
 PROFILE = "e2-field"
 HOST = "https://e2-demo-field-eng.cloud.databricks.com"
 WAREHOUSE_ID = "cd3b290bff658fa3"
 
 
+_BY_ID = itemgetter("id")
+_BY_IDENTIFIER = itemgetter("identifier")
+
+
 def sorted_by_id(items):
-    return sorted(items, key=lambda x: x.get("id", ""))
+    return sorted(items, key=_BY_ID)
 
 
 def print_step(num, title):
@@ -39,6 +49,14 @@ def print_result(label, value):
     print(f"  {label}: {value}")
 
 
+def print_acl(label, perms):
+    print(f"  {label}:")
+    for entry in perms.get("access_control_list", []):
+        principal = entry.get("user_name") or entry.get("group_name") or entry.get("display_name", "unknown")
+        levels = [p["permission_level"] for p in entry.get("all_permissions", [])]
+        print(f"    {principal}: {', '.join(levels)}")
+
+
 # ============================================================================
 # Space A: Inline measures, context, permissions
 # ============================================================================
@@ -79,7 +97,7 @@ def create_space_a():
             "question": ["Total revenue by quarter"],
             "sql": [
                 f"SELECT fiscal_quarter, SUM(amount) AS total_revenue ",
-                f"FROM {CATALOG}.{SCHEMA}.invoices ",
+                f"FROM {T_INVOICES} ",
                 "GROUP BY fiscal_quarter ORDER BY fiscal_quarter"
             ]
         },
@@ -88,8 +106,8 @@ def create_space_a():
             "question": ["Overdue invoices by company"],
             "sql": [
                 f"SELECT a.company_name, COUNT(*) AS overdue_count, SUM(i.amount) AS overdue_total ",
-                f"FROM {CATALOG}.{SCHEMA}.invoices i ",
-                f"JOIN {CATALOG}.{SCHEMA}.accounts a ON i.company_id = a.account_id ",
+                f"FROM {T_INVOICES} i ",
+                f"JOIN {T_ACCOUNTS} a ON i.company_id = a.account_id ",
                 "WHERE i.status = 'OVERDUE' ",
                 "GROUP BY a.company_name ORDER BY overdue_total DESC"
             ]
@@ -100,21 +118,21 @@ def create_space_a():
         "title": "Genie API Demo — Inline Measures",
         "description": "Demo space showing inline measures, context, sample questions, and permissions via the Genie API.",
         "warehouse_id": WAREHOUSE_ID,
-        "serialized_space": json.dumps({
+        "serialized_space": dumps({
             "version": 2,
             "config": {"sample_questions": sample_questions},
             "data_sources": {
                 "tables": sorted([
-                    {"identifier": f"{CATALOG}.{SCHEMA}.accounts"},
+                    {"identifier": T_ACCOUNTS},
                     {
-                        "identifier": f"{CATALOG}.{SCHEMA}.invoices",
+                        "identifier": T_INVOICES,
                         "column_configs": [
                             {"column_name": "amount", "enable_format_assistance": True},
                             {"column_name": "company_id", "enable_entity_matching": True, "enable_format_assistance": True},
                             {"column_name": "status", "enable_entity_matching": True, "enable_format_assistance": True},
                         ]
                     },
-                    {"identifier": f"{CATALOG}.{SCHEMA}.payments"},
+                    {"identifier": T_PAYMENTS},
                 ], key=lambda t: t["identifier"])
             },
             "instructions": {
@@ -148,16 +166,15 @@ def create_space_a():
 
 def create_metric_view():
     """Attempt to create a metric view via DDL. Returns result dict (does not raise)."""
-    import requests as _requests
     ddl = (
-        f"CREATE OR REPLACE VIEW {CATALOG}.{SCHEMA}.mv_invoice\n"
+        f"CREATE OR REPLACE VIEW {T_MV_INVOICE}\n"
         f"WITH METRICS\n"
         f"LANGUAGE YAML\n"
         f"AS $$\n"
         f"  version: 1.1\n"
         f"  comment: \"Invoice financial metrics\"\n"
         f"\n"
-        f"  source: {CATALOG}.{SCHEMA}.invoices\n"
+        f"  source: {T_INVOICES}\n"
         f"\n"
         f"  dimensions:\n"
         f"    - name: Company ID\n"
@@ -177,15 +194,16 @@ def create_metric_view():
         f"      expr: COUNT(DISTINCT invoice_id)\n"
         f"$$;"
     )
-    import config
     payload = {
         "statement": ddl,
         "warehouse_id": WAREHOUSE_ID,
         "format": "JSON_ARRAY",
+        # Runs in the background during Steps 1-6, so the full wait costs no
+        # wall time and gives a cold warehouse time to finish the DDL
         "wait_timeout": "50s",
     }
-    headers = {"Authorization": f"Bearer {config.TOKEN}", "Content-Type": "application/json"}
-    resp = _requests.post(f"{HOST}/api/2.0/sql/statements/", headers=headers, json=payload)
+    headers = {"Authorization": f"Bearer {ensure_token()}", "Content-Type": "application/json"}
+    resp = _SESSION.post(f"{HOST}/api/2.0/sql/statements/", headers=headers, json=payload, timeout=TIMEOUT)
     try:
         return resp.json()
     except Exception:
@@ -196,15 +214,15 @@ def create_space_b(with_metric_view=False):
     """Create Space B with metric views (or just tables if DDL isn't supported)."""
 
     tables = sorted([
-        {"identifier": f"{CATALOG}.{SCHEMA}.accounts"},
-        {"identifier": f"{CATALOG}.{SCHEMA}.invoices"},
-        {"identifier": f"{CATALOG}.{SCHEMA}.payments"},
+        {"identifier": T_ACCOUNTS},
+        {"identifier": T_INVOICES},
+        {"identifier": T_PAYMENTS},
     ], key=lambda t: t["identifier"])
 
     data_sources = {"tables": tables}
     if with_metric_view:
         data_sources["metric_views"] = [
-            {"identifier": f"{CATALOG}.{SCHEMA}.mv_invoice"}
+            {"identifier": T_MV_INVOICE}
         ]
 
     title = "Genie API Demo — Metric Views" if with_metric_view else "Genie API Demo — Data Sources"
@@ -218,7 +236,7 @@ def create_space_b(with_metric_view=False):
         "title": title,
         "description": desc,
         "warehouse_id": WAREHOUSE_ID,
-        "serialized_space": json.dumps({
+        "serialized_space": dumps({
             "version": 2,
             "data_sources": data_sources,
             "instructions": {
@@ -242,11 +260,15 @@ def main():
     print(f"Schema: {CATALOG}.{SCHEMA}")
     print("=" * 60)
 
-    import config
     init_from_cli(PROFILE)
     config.WAREHOUSE_ID = WAREHOUSE_ID
     print("Authenticated.\n")
 
+    # The metric view DDL for Step 7 does not touch Space A, so it runs in
+    # the background from the start.
+    pool = ThreadPoolExecutor(max_workers=1)
+    mv_future = pool.submit(create_metric_view)
+
     # ------------------------------------------------------------------
     # Step 1: Create Space A (inline measures + full context)
     # ------------------------------------------------------------------
@@ -263,20 +285,32 @@ def main():
     print_step(2, "Export & Verify Space A Context (04_context.py)")
     current_a = api_request("GET", f"/api/2.0/genie/spaces/{space_a}",
                             params={"include_serialized_space": "true"})
-    config_a = json.loads(current_a["serialized_space"])
-    ctx = config_a.get("instructions", {})
-    snippets = ctx.get("sql_snippets", {})
-    sample_qs = config_a.get("config", {}).get("sample_questions", [])
-
-    print_result("text_instructions", f"{len(ctx.get('text_instructions', []))} entry")
-    print_result("example_question_sqls", f"{len(ctx.get('example_question_sqls', []))} queries")
-    print_result("sql_snippets.measures", f"{len(snippets.get('measures', []))} measures")
-    print_result("sql_snippets.filters", f"{len(snippets.get('filters', []))} filters")
-    print_result("sql_snippets.expressions", f"{len(snippets.get('expressions', []))} expressions")
+    # space_state is the authoritative copy of Space A from here on: Steps 3-6
+    # mutate it and PATCH it back without re-fetching or re-parsing
+    space_state = loads(current_a["serialized_space"])
+    # One destructuring pass; the prints below only read these locals
+    ctx = space_state.get("instructions") or {}
+    snippets = ctx.get("sql_snippets") or {}
+    sample_qs = (space_state.get("config") or {}).get("sample_questions") or []
+    tables_a = (space_state.get("data_sources") or {}).get("tables") or []
+    text_instructions = ctx.get("text_instructions") or []
+    example_sqls = ctx.get("example_question_sqls") or []
+    measures = snippets.get("measures") or []
+    filters = snippets.get("filters") or []
+    expressions = snippets.get("expressions") or []
+    # Steps 3-4 insort into these; sort once so that doesn't rest on the
+    # server returning them in order (a no-op when it does)
+    measures.sort(key=_BY_ID)
+    tables_a.sort(key=_BY_IDENTIFIER)
+
+    print_result("text_instructions", f"{len(text_instructions)} entry")
+    print_result("example_question_sqls", f"{len(example_sqls)} queries")
+    print_result("sql_snippets.measures", f"{len(measures)} measures")
+    print_result("sql_snippets.filters", f"{len(filters)} filters")
+    print_result("sql_snippets.expressions", f"{len(expressions)} expressions")
     print_result("config.sample_questions", f"{len(sample_qs)} questions")
 
-    tables_a = config_a.get("data_sources", {}).get("tables", [])
-    invoices = next((t for t in tables_a if "invoices" in t["identifier"]), None)
+    invoices = {t["identifier"]: t for t in tables_a}.get(T_INVOICES)
     col_configs = invoices.get("column_configs", []) if invoices else []
     print_result("column_configs (invoices)", f"{len(col_configs)} columns")
 
@@ -284,22 +318,14 @@ def main():
     # Step 3: Update Space A — add a measure via PATCH (01_metrics.py)
     # ------------------------------------------------------------------
     print_step(3, "Update Space A — Add Inline Measure via PATCH (01_metrics.py)")
-    config_a["instructions"]["sql_snippets"]["measures"].append({
+    # Insert in id order; the list is already sorted, so no full re-sort is needed
+    insort(space_state["instructions"]["sql_snippets"]["measures"], {
         "id": gen_id(),
         "sql": ["SUM(amount) / NULLIF(COUNT(DISTINCT invoice_id), 0)"],
         "display_name": "revenue_per_invoice"
-    })
-    config_a["instructions"]["sql_snippets"]["measures"] = sorted_by_id(
-        config_a["instructions"]["sql_snippets"]["measures"]
-    )
-    api_request("PATCH", f"/api/2.0/genie/spaces/{space_a}", json_data={
-        "serialized_space": json.dumps(config_a),
-    })
-    # Verify
-    verify_a = api_request("GET", f"/api/2.0/genie/spaces/{space_a}",
-                           params={"include_serialized_space": "true"})
-    verify_config = json.loads(verify_a["serialized_space"])
-    measure_count = len(verify_config["instructions"]["sql_snippets"]["measures"])
+    }, key=_BY_ID)
+    patch_serialized_space(space_a, space_state)
+    measure_count = len(space_state["instructions"]["sql_snippets"]["measures"])
     print_result("Measures after update", f"{measure_count} (was 4, added revenue_per_invoice)")
 
     # ------------------------------------------------------------------
@@ -307,30 +333,19 @@ def main():
     # ------------------------------------------------------------------
     print_step(4, "Update Space A — Remove & Re-add Data Source (02_data_sources.py)")
     # Remove payments
-    verify_config["data_sources"]["tables"] = [
-        t for t in verify_config["data_sources"]["tables"]
-        if t["identifier"] != f"{CATALOG}.{SCHEMA}.payments"
+    space_state["data_sources"]["tables"] = [
+        t for t in space_state["data_sources"]["tables"]
+        if t["identifier"] != T_PAYMENTS
     ]
-    api_request("PATCH", f"/api/2.0/genie/spaces/{space_a}", json_data={
-        "serialized_space": json.dumps(verify_config),
-    })
-    check = api_request("GET", f"/api/2.0/genie/spaces/{space_a}",
-                        params={"include_serialized_space": "true"})
-    check_config = json.loads(check["serialized_space"])
-    tables_now = [t["identifier"] for t in check_config["data_sources"]["tables"]]
+    patch_serialized_space(space_a, space_state)
+    tables_now = [t["identifier"] for t in space_state["data_sources"]["tables"]]
     print_result("After removing payments", tables_now)
 
     # Re-add payments
-    check_config["data_sources"]["tables"].append({"identifier": f"{CATALOG}.{SCHEMA}.payments"})
-    check_config["data_sources"]["tables"] = sorted(
-        check_config["data_sources"]["tables"], key=lambda t: t["identifier"]
-    )
-    api_request("PATCH", f"/api/2.0/genie/spaces/{space_a}", json_data={
-        "serialized_space": json.dumps(check_config),
-    })
-    check2 = api_request("GET", f"/api/2.0/genie/spaces/{space_a}",
-                         params={"include_serialized_space": "true"})
-    tables_final = [t["identifier"] for t in json.loads(check2["serialized_space"])["data_sources"]["tables"]]
+    insort(space_state["data_sources"]["tables"],
+           {"identifier": T_PAYMENTS}, key=_BY_IDENTIFIER)
+    patch_serialized_space(space_a, space_state)
+    tables_final = [t["identifier"] for t in space_state["data_sources"]["tables"]]
     print_result("After re-adding payments", tables_final)
 
     # ------------------------------------------------------------------
@@ -340,39 +355,25 @@ def main():
 
     # GET current
     perms = api_request("GET", f"/api/2.0/permissions/genie/{space_a}")
-    print("  Current permissions:")
-    for entry in perms.get("access_control_list", []):
-        principal = entry.get("user_name") or entry.get("group_name") or entry.get("display_name", "unknown")
-        levels = [p["permission_level"] for p in entry.get("all_permissions", [])]
-        print(f"    {principal}: {', '.join(levels)}")
+    print_acl("Current permissions", perms)
 
-    # PATCH: grant CAN_RUN to users, CAN_EDIT to admins
-    api_request("PATCH", f"/api/2.0/permissions/genie/{space_a}", json_data={
+    # PATCH: grant CAN_RUN to users, CAN_EDIT to admins. The response is the
+    # full updated ACL, so there is no need to GET it again.
+    updated = api_request("PATCH", f"/api/2.0/permissions/genie/{space_a}", json_data={
         "access_control_list": [
             {"group_name": "users", "permission_level": "CAN_RUN"},
             {"group_name": "admins", "permission_level": "CAN_EDIT"},
         ]
     })
-
-    perms2 = api_request("GET", f"/api/2.0/permissions/genie/{space_a}")
-    print("  Updated permissions:")
-    for entry in perms2.get("access_control_list", []):
-        principal = entry.get("user_name") or entry.get("group_name") or entry.get("display_name", "unknown")
-        levels = [p["permission_level"] for p in entry.get("all_permissions", [])]
-        print(f"    {principal}: {', '.join(levels)}")
+    print_acl("Updated permissions", updated)
 
     # ------------------------------------------------------------------
     # Step 6: Update Space A — append context (04_context.py)
     # ------------------------------------------------------------------
     print_step(6, "Update Space A — Append Text Instruction (04_context.py)")
-    latest = api_request("GET", f"/api/2.0/genie/spaces/{space_a}",
-                         params={"include_serialized_space": "true"})
-    latest_config = json.loads(latest["serialized_space"])
-    ti = latest_config["instructions"]["text_instructions"][0]["content"]
+    ti = space_state["instructions"]["text_instructions"][0]["content"]
     ti.append("\nOverdue invoices are those with status = 'OVERDUE'.")
-    api_request("PATCH", f"/api/2.0/genie/spaces/{space_a}", json_data={
-        "serialized_space": json.dumps(latest_config),
-    })
+    patch_serialized_space(space_a, space_state)
     print_result("Text instruction lines", f"{len(ti)} (appended overdue definition)")
 
     # ------------------------------------------------------------------
@@ -380,15 +381,16 @@ def main():
     # ------------------------------------------------------------------
     print_step(7, "Create Space B — Metric Views (01_metrics.py Approach B)")
 
-    print("  Attempting metric view DDL...")
-    mv_result = create_metric_view()
+    print("  Waiting for metric view DDL (started in the background)...")
+    mv_result = mv_future.result()
+    pool.shutdown()
     mv_state = mv_result.get("status", {}).get("state", "")
     mv_ok = mv_state == "SUCCEEDED"
 
     if mv_ok:
-        print_result("Metric view", f"CREATED — {CATALOG}.{SCHEMA}.mv_invoice")
+        print_result("Metric view", f"CREATED — {T_MV_INVOICE}")
     else:
-        error = mv_result.get("status", {}).get("error", {}).get("message", "")[:100]
+        error = mv_result.get("status", {}).get("error", {}).get("message", "")[:100] or mv_state
         print_result("Metric view", f"SKIPPED — DDL not supported on this workspace ({error})")
 
     result_b = create_space_b(with_metric_view=mv_ok)
@@ -400,7 +402,7 @@ def main():
     # Verify Space B
     current_b = api_request("GET", f"/api/2.0/genie/spaces/{space_b}",
                             params={"include_serialized_space": "true"})
-    config_b = json.loads(current_b["serialized_space"])
+    config_b = loads(current_b["serialized_space"])
     tables_b = [t["identifier"] for t in config_b.get("data_sources", {}).get("tables", [])]
     mvs = [m["identifier"] for m in config_b.get("data_sources", {}).get("metric_views", [])]
     print_result("Tables", tables_b)